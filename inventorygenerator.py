@@ -9,11 +9,42 @@ for automation tasks. It is intended for use with
 Ansible Tower/AWX environments.
 """
 import os
+import sys
 import json
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
 import psycopg2
 
+try:
+    # orjson is optional, it only speeds up writing large inventories.
+    import orjson
+except ImportError:
+    orjson = None  # type: ignore[assignment]
 
-def fetch_hosts_from_db():
+# Change JOB_NAME to whatever you use for Prometheus.
+JOB_NAME = "generic-prometheus-job-name"
+UNKNOWN_JOB_NAME = "generic-metrics"
+SERVER_DESCRIPTION = "Server in my org"
+
+# TEST_TOKEN, ENVIRONMENTS and ROLES are the only place hostname tokens are defined.
+# Hosts with TEST_TOKEN in their hostname are sorted even without a TEAMNAME environment.
+TEST_TOKEN = "TEST"
+
+# Environments, in priority order, keyed by the token found in the hostname.
+ENVIRONMENTS = {
+    "DEV": ("DEV_ENVIRONMENT", ["DEV"]),
+    "TEST1": ("TEST1_ENVIRONMENT", ["TEST1"]),
+    "TEST2": ("TEST2_ENVIRONMENT", ["TEST2"]),
+}
+
+# Roles, in priority order, as (hostname tokens, groups). Only the first match applies.
+ROLES = [
+    (("HTTP", "WEB"), ["WEB", "WEB_PATCHING"]),
+    (("APP", "TOMCAT"), ["APP", "TOMCAT_PATCHING"]),
+]
+
+
+def fetch_hosts_from_db() -> List[Dict[str, Any]]:
     """
     Fetch host data from a PostgreSQL database.
 
@@ -41,15 +72,26 @@ def fetch_hosts_from_db():
         print(f"Database connection failed: {e}")
         return []
 
-    cursor = conn.cursor()
+    # A named cursor is server-side, so rows are streamed in batches
+    # of itersize instead of being loaded into memory all at once.
+    cursor = conn.cursor(name="inv_stream")
+    cursor.itersize = 2000
 
     # Query used, only returning the servers that have the specific tags.
+    # The first TEAMNAME- tag of each server is extracted by the database.
     query = """
             SELECT
                 d."Name" as "Datasource Name",
                 a."ObjectId" as "VM Id",
                 a."ObjectName" as "VM Name",
-                cast(a."Object"::json AS json) -> 'tags as "Tags"
+                (
+                    SELECT t.tag ->> 'tag'
+                    FROM jsonb_array_elements(a."Object"::jsonb -> 'tags' -> '$values')
+                        WITH ORDINALITY AS t(tag, idx)
+                    WHERE t.tag ->> 'tag' LIKE 'TEAMNAME-%'
+                    ORDER BY t.idx
+                    LIMIT 1
+                ) as "app_region"
             FROM
                 dbo."Objects" a
             INNER JOIN
@@ -72,57 +114,50 @@ def fetch_hosts_from_db():
     # Execute the query
     cursor.execute(query)
 
-    # Fetch the data
-    sql_data = cursor.fetchall()
-
-    # Close the connection
-    conn.close()
-
-    # Process the results and extract the TEAMNAME tag for each host
-    json_like_data = []
-
-    for row in sql_data:
-        tags_raw = row[3] if row[3] else {}
-        app_region = None
-
-        # Check if tags_raw is a string that needs to be loaded as JSON
-        if isinstance(tags_raw, str):
-            try:
-                tags_dict = json.loads(tags_raw)
-            except json.JSONDecodeError as e:
-                print(f"Error decoding JSON from tags: {tags_raw} - {e}")
-                continue
-        elif isinstance(tags_raw, dict):
-            # If it's already a dictionary, no need for json.loads
-            tags_dict = tags_raw
-
-        else:
-            print(f"Unexepected type for tags data: {type(tags_raw)} - {tags_raw}")
-            continue
-
-        # Get the array of tags
-        tags_array = tags_dict.get("$values", [])
-        for tag in tags_array:
-            tag_value = tag.get("tag", "")
-            if tag_value.startswith(
-                "TEAMNAME-"
-            ):  # Check if the tag starts with "TEAMNAME-"
-                app_region = tag_value
-                break  # Once we found a match, we exit the loop
+    # Process the results
+    json_like_data: List[Dict[str, Any]] = []
 
+    for row in cursor:
         json_like_data.append(
             {
                 "Name": row[0],
                 "ObjectId": row[1],
                 "ObjectName": row[2],
-                "app_region": app_region,
+                "app_region": row[3],
             }
         )
 
+    # Close the cursor and the connection
+    cursor.close()
+    conn.close()
+
     return json_like_data
 
 
-def generate_inventory(hosts):
+def _classify(hostname: str) -> Optional[Tuple[str, List[str]]]:
+    """
+    Find the environment and groups of a host from its hostname.
+
+    The first matching environment wins, followed by the
+    first matching role. Returns None when the hostname has
+    no environment token, so the host can be sorted as UNKNOWN.
+    """
+    for token, (env_name, env_groups) in ENVIRONMENTS.items():
+        if token in hostname:
+            groups = list(env_groups)
+            break
+    else:
+        return None
+
+    for role_tokens, role_groups in ROLES:
+        if any(token in hostname for token in role_tokens):
+            groups.extend(role_groups)
+            break
+
+    return env_name, groups
+
+
+def generate_inventory(hosts: List[Dict[str, Any]]) -> Dict[str, Any]:
     """
     Generate an Ansible inventory from a list of hosts.
 
@@ -140,73 +175,66 @@ def generate_inventory(hosts):
         dict: A dictionary representing the Ansible
         inventory structured for use in Ansible playbooks.
     """
-    inventory = {"_meta": {"hostvars": {}}}
+    inventory: Dict[str, Any] = {"_meta": {"hostvars": {}}}
+    # Hosts of each group, copied into the inventory once every host is sorted.
+    groups_map: Dict[str, List[str]] = defaultdict(list)
 
     # Define the global variables I would like servers to have when imported into ansible
     for host in hosts:
-        app_region = host.get("app_region")
-        hostname = host.get("ObjectName")
+        # app_region is NULL for servers without a TEAMNAME- tag.
+        app_region = host.get("app_region") or ""
+        hostname = host["ObjectName"]
 
         # Sort environment based on what is present in the hostname.
-        if any(
-            test_env in app_region or "TEST" in hostname
-            for test_env in ["DEV", "TEST1", "TEST2"]
-        ):
-            groups = []
-            # Change job_name to whatever you use for Prometheus.
-            job_name = "generic-prometheus-job-name"
-            # connected_hosts is a silly variable, used for documenting what connects to what.
-            connected_hosts = []
-
+        classified = None
+        if TEST_TOKEN in hostname or any(env in app_region for env in ENVIRONMENTS):
             # Further sorting of environments.
-            if "DEV" in hostname:
-                env_name = 'DEV_ENVIRONMENT'
-                groups.extend(["DEV"])
-                if "HTTP" in hostname or "WEB" in hostname:
-                    groups.extend(["WEB", "WEB_PATCHING"])
-                elif "APP" in hostname or "TOMCAT" in hostname:
-                    groups.extend(["APP", "TOMCAT_PATCHING"])
-
-            elif "TEST1" in hostname:
-                env_name = 'TEST1_ENVIRONMENT'
-                groups.extend(["TEST1"])
-                if "HTTP" in hostname or "WEB" in hostname:
-                    groups.extend(["WEB", "WEB_PATCHING"])
-                elif "APP" in hostname or "TOMCAT" in hostname:
-                    groups.extend(["APP", "TOMCAT_PATCHING"])
-
-            elif "TEST2" in hostname:
-                env_name = 'TEST2_ENVIRONMENT'
-                groups.extend(["TEST2"])
-                if "HTTP" in hostname or "WEB" in hostname:
-                    groups.extend(["WEB", "WEB_PATCHING"])
-                elif "APP" in hostname or "TOMCAT" in hostname:
-                    groups.extend(["APP", "TOMCAT_PATCHING"])
+            classified = _classify(hostname)
+
+        if classified is not None:
+            env_name, groups = classified
+            job_name = JOB_NAME
+            # connected_hosts is a silly variable, used for documenting what connects to what.
+            connected_hosts: List[str] = []
 
         # Lastly, we want to catch anything that didn't work in the filter.
         else:
-            hostname = host["ObjectName"]
-            groups = "UNKNOWN"
-            job_name = "generic-metrics"
+            env_name = "UNKNOWN_ENVIRONMENT"
+            groups = ["UNKNOWN"]
+            job_name = UNKNOWN_JOB_NAME
             connected_hosts = []
 
         for group in groups:
-            if group not in inventory:
-                inventory[group] = {"hosts": []}
-            inventory[group]["hosts"].append(hostname)
+            groups_map[group].append(hostname)
 
         # Define the host's varaibles
         inventory["_meta"]["hostvars"][hostname] = {
             "job_name": job_name,
             "env_name": env_name,
-            "server_description": "Server in my org",
+            "server_description": SERVER_DESCRIPTION,
             "connected_hosts": connected_hosts,
         }
 
+    for group, group_hosts in groups_map.items():
+        inventory[group] = {"hosts": group_hosts}
+
     return inventory
 
 
-if __name__ == "__main__":
+def main() -> None:
+    """Fetch the hosts and write their Ansible inventory to stdout."""
     hosts = fetch_hosts_from_db()
     inventory = generate_inventory(hosts)
-    print(json.dumps(inventory))
+    if orjson is not None:
+        # orjson is a C extension, so pylint cannot see its members.
+        # pylint: disable=no-member
+        sys.stdout.buffer.write(
+            orjson.dumps(inventory, option=orjson.OPT_APPEND_NEWLINE)
+        )
+    else:
+        json.dump(inventory, sys.stdout)
+        sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()